@@ -3,6 +3,7 @@ import math
 import matplotlib.pyplot as plt
 import json
 import argparse
+from scipy.spatial import cKDTree
 
 from utils import calculate_angle, calculate_trajectory_distance, transform_trajectory_with_angles
 
@@ -17,6 +18,10 @@ class BaseController:
         self.dt = dt
         self.wheelbase = wheelbase  # Wheelbase of the vehicle
         self.map_instance = map_instance  # Map instance for collision checking
+
+        # KD-tree over the reference trajectory points, rebuilt only when the reference changes
+        self._ref_tree = None
+        self._ref_tree_source = None
     
     def compute_control(self, current_state, next_state):
         x, y, theta, v = current_state
@@ -50,17 +55,20 @@ class BaseController:
 
         return a_ref, delta_ref
 
-    def apply_control(self, state, control_input):
+    def predict(self, state, control_input):
         x, y, theta, v = state
         a_ref, delta_ref = control_input
 
         # Update the state using the kinematic bicycle model
-        x += v * np.cos(theta) * self.dt
-        y += v * np.sin(theta) * self.dt
-        theta += v / self.wheelbase * np.tan(delta_ref) * self.dt
+        x += v * math.cos(theta) * self.dt
+        y += v * math.sin(theta) * self.dt
+        theta += v / self.wheelbase * math.tan(delta_ref) * self.dt
         v += a_ref * self.dt
 
-        return np.array([x, y, theta, v])
+        return x, y, theta, v
+
+    def apply_control(self, state, control_input):
+        return np.array(self.predict(state, control_input))
 
     def is_collision_free(self, current_position, target_position):
         x1, y1 = current_position[:2]
@@ -128,17 +136,18 @@ class BaseController:
         distance_to_goal = np.hypot(current_state[0] - goal_position[0], current_state[1] - goal_position[1])
         return distance_to_goal < tolerance
 
+    def find_closest_index(self, ref_trajectory, x, y):
+        if self._ref_tree_source is not ref_trajectory:
+            self._ref_tree = cKDTree(ref_trajectory[:, :2])
+            self._ref_tree_source = ref_trajectory
+        _, index = self._ref_tree.query((x, y))
+        return int(index)
+
     def find_target_state(self, state, ref_trajectory):
         x, y, theta = state[:3]
-        min_distance = float('inf')
-        target_index = 0
 
         # Find the closest point in the trajectory
-        for i in range(len(ref_trajectory)):
-            distance = np.hypot(ref_trajectory[i, 0] - x, ref_trajectory[i, 1] - y)
-            if distance < min_distance:
-                min_distance = distance
-                target_index = i
+        target_index = self.find_closest_index(ref_trajectory, x, y)
 
         # target_index가 경로의 끝을 초과하지 않도록 마지막 지점을 선택
         if target_index >= len(ref_trajectory):
@@ -154,13 +163,13 @@ class BaseController:
 
     def predict_trajectory(self, current_state, target_point, n_steps=10, velocity=0.5):
         # Predict future trajectory using the kinematic bicycle model
-        predicted_trajectory = []
-        state = current_state.copy()
-        for _ in range(n_steps):
+        predicted_trajectory = np.empty((n_steps, 4))
+        state = tuple(current_state)
+        for i in range(n_steps):
             control_input = self.compute_control(state, target_point)
-            state = self.apply_control(state, control_input)
-            predicted_trajectory.append(state.copy())
-        return np.array(predicted_trajectory)
+            state = self.predict(state, control_input)
+            predicted_trajectory[i] = state
+        return predicted_trajectory
 
     def follow_trajectory(self, start_pose, ref_trajectory, goal_position, show_process=False):
         # Initialize the state and trajectory
@@ -1,8 +1,15 @@
 import numpy as np
+import math
 import matplotlib.pyplot as plt
 import json
 import argparse
 
+try:
+    from numba import njit, prange, get_num_threads
+except ImportError:
+    njit = None
+    prange = range
+
 from utils import calculate_angle, calculate_trajectory_distance, transform_trajectory_with_angles
 
 from map.parking_lot import ParkingLot
@@ -13,67 +20,134 @@ from controller.base_controller import BaseController
 
 from route_planner.informed_trrt_star_planner import Pose, InformedTRRTStar
 
+def _rollout_and_score(current_state, ref_trajectory, a_refs, delta_refs, dt, wheelbase, horizon, occ, n_workers):
+    # Fused kinematic bicycle rollout + squared-error cost for every candidate
+    # Worker w scores candidates w, w + n_workers, ... and prunes a rollout as soon as its running
+    # cost reaches the best complete collision-free cost that worker has seen (branch and bound).
+    # Pruned candidates get cost inf; each candidate writes only its own costs[i] / collision[i].
+    height, width = occ.shape
+    costs = np.empty(len(a_refs))
+    collision = np.zeros(len(a_refs), dtype=np.bool_)
+    for w in prange(n_workers):
+        min_cost = np.inf
+        for i in range(w, len(a_refs), n_workers):
+            x, y, theta, v = current_state[0], current_state[1], current_state[2], current_state[3]
+            a_ref = a_refs[i]
+            tan_delta = math.tan(delta_refs[i])
+            cost = 0.0
+            for t in range(horizon):
+                x += v * math.cos(theta) * dt
+                y += v * math.sin(theta) * dt
+                theta += v / wheelbase * tan_delta * dt
+                v += a_ref * dt
+                # Occupancy lookup on the nearest cell, clipped to the map
+                ix = min(max(int(math.floor(x + 0.5)), 0), width - 1)
+                iy = min(max(int(math.floor(y + 0.5)), 0), height - 1)
+                if occ[iy, ix]:
+                    collision[i] = True
+                    break
+                cost += (x - ref_trajectory[t, 0]) ** 2 + (y - ref_trajectory[t, 1]) ** 2 \
+                    + (theta - ref_trajectory[t, 2]) ** 2 + (v - ref_trajectory[t, 3]) ** 2
+                if cost >= min_cost:
+                    cost = np.inf
+                    break
+            if not collision[i] and cost < min_cost:
+                min_cost = cost
+            costs[i] = cost
+    return costs, collision
+
+if njit is not None:
+    # fastmath without nnan/ninf: the kernel relies on inf as the pruned-cost sentinel
+    _rollout_and_score = njit(cache=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'}, parallel=True)(_rollout_and_score)
+else:
+    _rollout_and_score = None
+
 class MPCController(BaseController):
     def __init__(self, horizon, dt, wheelbase, map_instance):
         super().__init__(dt, wheelbase, map_instance)
         self.horizon = horizon
+        self._occ = map_instance.to_occupancy_array()
+
+        # 가속도, 조향 각도 후보 (7 x 7), 매 스텝 재사용
+        a_grid, delta_grid = np.meshgrid(np.linspace(-1, 1, 7), np.linspace(-np.pi/6, np.pi/6, 7), indexing="ij")
+        self._a_refs = a_grid.ravel()
+        self._delta_refs = delta_grid.ravel()
 
     def compute_cost(self, predicted_states, ref_trajectory):
-        cost = 0
-        for i in range(len(predicted_states)):
-            if i >= len(ref_trajectory):
-                break
-            state = predicted_states[i]
-            ref_state = ref_trajectory[i]
-            cost += np.sum((state - ref_state) ** 2)
-        return cost
+        n_steps = min(len(predicted_states), len(ref_trajectory))
+        return float(((np.asarray(predicted_states[:n_steps]) - ref_trajectory[:n_steps]) ** 2).sum())
+
+    def rollout_candidates(self, current_state, a_refs, delta_refs, n_steps):
+        # Roll out every (a_ref, delta_ref) candidate at once: shape (n_steps, n_candidates, 4)
+        tan_delta = np.tan(delta_refs)
+        x = np.full(len(a_refs), current_state[0], dtype=float)
+        y = np.full(len(a_refs), current_state[1], dtype=float)
+        theta = np.full(len(a_refs), current_state[2], dtype=float)
+        v = np.full(len(a_refs), current_state[3], dtype=float)
+
+        trajectories = np.empty((n_steps, len(a_refs), 4))
+        for t in range(n_steps):
+            # Same kinematic bicycle model as apply_control, stepped on all candidates
+            x = x + v * np.cos(theta) * self.dt
+            y = y + v * np.sin(theta) * self.dt
+            theta = theta + v / self.wheelbase * tan_delta * self.dt
+            v = v + a_refs * self.dt
+            trajectories[t, :, 0] = x
+            trajectories[t, :, 1] = y
+            trajectories[t, :, 2] = theta
+            trajectories[t, :, 3] = v
+        return trajectories
+
+    def compute_candidate_costs(self, trajectories, ref_trajectory):
+        # Squared error of every candidate against the reference in a single reduction
+        return ((trajectories - ref_trajectory[:len(trajectories), None, :]) ** 2).sum(axis=(0, 2))
+
+    def check_candidate_collisions(self, trajectories):
+        # trajectories (n_steps, n_candidates, 4)의 모든 상태를 한 번에 점유 격자 조회
+        height, width = self._occ.shape
+        ix = np.clip(np.floor(trajectories[..., 0] + 0.5), 0, width - 1).astype(np.intp)
+        iy = np.clip(np.floor(trajectories[..., 1] + 0.5), 0, height - 1).astype(np.intp)
+        return self._occ[iy, ix].any(axis=0)
+
+    def score_candidates(self, current_state, ref_trajectory, a_refs, delta_refs, n_steps):
+        if _rollout_and_score is not None:
+            return _rollout_and_score(
+                np.asarray(current_state, dtype=np.float64),
+                np.ascontiguousarray(ref_trajectory[:n_steps], dtype=np.float64),
+                a_refs, delta_refs, float(self.dt), float(self.wheelbase), n_steps, self._occ,
+                min(get_num_threads(), len(a_refs)),
+            )
+        # numba가 없으면 NumPy 일괄 rollout 사용
+        trajectories = self.rollout_candidates(current_state, a_refs, delta_refs, n_steps)
+        return self.compute_candidate_costs(trajectories, ref_trajectory), self.check_candidate_collisions(trajectories)
 
     def optimize_control(self, current_state, ref_trajectory):
+        # predicted states와 reference trajectory 길이를 맞춤
+        n_steps = min(self.horizon, len(ref_trajectory))
+
+        # Score candidates whose final speed best matches the reference first, so a low bound is found early
+        order = np.argsort(np.abs(current_state[3] + self._a_refs * n_steps * self.dt - ref_trajectory[n_steps - 1, 3]), kind="stable")
+        a_refs = self._a_refs[order]
+        delta_refs = self._delta_refs[order]
+        costs, collision = self.score_candidates(current_state, ref_trajectory, a_refs, delta_refs, n_steps)
+
+        # validate collision-free states
         best_control = None
         best_predicted_states = None
-        min_cost = float('inf')
-
-        predicted_lines = []
-
-        for a_ref in np.linspace(-1, 1, 7):  # 가속도 범위를 세밀하게 설정
-            for delta_ref in np.linspace(-np.pi/6, np.pi/6, 7):  # 조향 각도 범위 설정
-                predicted_states = []
-                state = current_state
-                for _ in range(self.horizon):
-                    state = self.apply_control(state, (a_ref, delta_ref))
-                    predicted_states.append(list(state))
-
-                # predicted states와 reference trajectory 길이를 맞춤
-                if len(predicted_states) > len(ref_trajectory):
-                    predicted_states = predicted_states[:len(ref_trajectory)]
-
-                # validate collision-free states
-                if all(self.is_collision_free(state, s) for s in predicted_states):
-                    cost = self.compute_cost(predicted_states, ref_trajectory)
-                    if cost < min_cost:
-                        min_cost = cost
-                        best_control = (a_ref, delta_ref)
-                        best_predicted_states = predicted_states
-
-                # print(f"predicted_states: {predicted_states}")
-                predicted_states = np.array(predicted_states)
-                predicted_lines.append(plt.plot(predicted_states[:, 0], predicted_states[:, 1], "b-", label="Predicted Path")[0])
-
-        # plt.pause(0.001)
-        for line in predicted_lines:
-            line.remove()
-        predicted_lines = []
-        
+        costs = np.where(collision, np.inf, costs)
+        best_index = np.argmin(costs)
+        if np.isfinite(costs[best_index]):
+            best_control = (a_refs[best_index], delta_refs[best_index])
+            best_predicted_states = self.rollout_candidates(
+                current_state, a_refs[best_index:best_index + 1], delta_refs[best_index:best_index + 1], n_steps
+            )[:, 0]
+
         # best_control이 없을 때, 기본 움직임을 설정하고 최소한의 예측 상태 생성
         if best_control is None:
             best_control = (0.5, 0.0)  # 기본값: 천천히 직진
-            best_predicted_states = []
-            state = current_state
-            for _ in range(self.horizon):
-                state = self.apply_control(state, best_control)
-                best_predicted_states.append(list(state))
+            best_predicted_states = self.rollout_candidates(current_state, np.array([0.5]), np.array([0.0]), self.horizon)[:, 0]
 
-        return best_control, np.array(best_predicted_states)
+        return best_control, best_predicted_states
 
     def follow_trajectory(self, start_pose, ref_trajectory, goal_position, show_process=False):
         # Initialize the state and trajectory
@@ -92,36 +166,32 @@ class MPCController(BaseController):
         # Maximum index in the reference trajectory
         max_ref_index = len(ref_trajectory) - 1
 
+        # Reference segments for the closest-point-on-polyline projection
+        ref_segments = ref_trajectory[1:, :2] - ref_trajectory[:-1, :2]
+        ref_segment_lengths2 = (ref_segments ** 2).sum(axis=1)
+
+        # Pad the reference once with the last point so every ref_segment is horizon long
+        ref_padded = np.vstack((ref_trajectory, np.tile(ref_trajectory[-1], (self.horizon, 1))))
+
+        # Reuse the same artists every step instead of adding new lines
+        if show_process:
+            predicted_line, = plt.plot([], [], "b--")
+            ref_line, = plt.plot([], [], "g--")
+            trajectory_line, = plt.plot([], [], "xr")
+            trajectory_x, trajectory_y = [current_state[0]], [current_state[1]]
+
         # Follow the reference trajectory
         while True:
             if self.is_goal_reached(current_state, goal_position):
                 print("Goal reached successfully!")
                 break
 
-            # Limit the search window to ±window_size around ref_index
-            window_size = 10  # Adjust this parameter as needed
-            search_start = max(ref_index - window_size, 0)
-            search_end = min(ref_index + window_size, max_ref_index)
-
-            # Compute distances in the search window
-            search_indices = np.arange(search_start, search_end + 1)
-            ref_points = ref_trajectory[search_indices, :2]
-            distances = np.linalg.norm(ref_points - current_state[:2], axis=1)
-
-            # Find the index of the closest point in the search window
-            min_distance_index = np.argmin(distances)
-            ref_index = search_indices[min_distance_index]
-
-            # Extract ref_segment from ref_index to ref_index + horizon
-            ref_segment_end = min(ref_index + self.horizon, max_ref_index + 1)
-            ref_segment = ref_trajectory[ref_index:ref_segment_end]
+            # Advance ref_index while the vehicle projects past the end of the current segment
+            while ref_index < max_ref_index and np.dot(current_state[:2] - ref_trajectory[ref_index, :2], ref_segments[ref_index]) >= ref_segment_lengths2[ref_index]:
+                ref_index += 1
 
-            # If ref_segment is shorter than horizon, pad it with the last point
-            if len(ref_segment) < self.horizon:
-                last_point = ref_segment[-1]
-                num_padding = self.horizon - len(ref_segment)
-                padding = np.tile(last_point, (num_padding, 1))
-                ref_segment = np.vstack((ref_segment, padding))
+            # Extract ref_segment from ref_index to ref_index + horizon (view into the padded reference)
+            ref_segment = ref_padded[ref_index:ref_index + self.horizon]
 
             control_input, predicted_states = self.optimize_control(current_state, ref_segment)
             next_state = self.apply_control(current_state, control_input)
@@ -134,10 +204,16 @@ class MPCController(BaseController):
 
             # Plot predicted states and reference segment if desired
             if show_process:
-                plt.plot(predicted_states[:, 0], predicted_states[:, 1], "b--")
-                plt.plot(ref_segment[:, 0], ref_segment[:, 1], "g--")
-                plt.plot(current_state[0], current_state[1], "xr")
-                plt.pause(0.001)
+                trajectory_x.append(current_state[0])
+                trajectory_y.append(current_state[1])
+                if len(trajectory) % 10 == 0:
+                    predicted_line.set_data(predicted_states[:, 0], predicted_states[:, 1])
+                    ref_line.set_data(ref_segment[:, 0], ref_segment[:, 1])
+                    trajectory_line.set_data(trajectory_x, trajectory_y)
+                    plt.pause(0.001)
+
+        if show_process:
+            trajectory_line.set_data(trajectory_x, trajectory_y)
 
         # If the goal is still not reached, adjust the final position
         if not self.is_goal_reached(current_state, goal_position):
@@ -66,6 +66,12 @@ class MultiPurposeMPCController(MPCController):
 
         return cost
 
+    def score_candidates(self, current_state, ref_trajectory, a_refs, delta_refs, n_steps):
+        # 모드별 비용은 후보마다 compute_cost로 계산
+        trajectories = self.rollout_candidates(current_state, a_refs, delta_refs, n_steps)
+        costs = np.array([self.compute_cost(trajectories[:, i], ref_trajectory) for i in range(trajectories.shape[1])])
+        return costs, self.check_candidate_collisions(trajectories)
+
     def follow_trajectory(self, start_pose, ref_trajectory, goal_position, show_process=False):
         # 초기 상태와 경로 초기화
         start_pose.theta = calculate_angle(start_pose.x, start_pose.y, ref_trajectory[1, 0], ref_trajectory[1, 1])
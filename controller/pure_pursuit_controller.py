@@ -21,15 +21,9 @@ class PurePursuitController(BaseController):
 
     def find_target_state(self, state, ref_trajectory):
         x, y, theta = state[:3]
-        min_distance = float('inf')
-        target_index = 0
 
         # Find the closest point in the trajectory
-        for i in range(len(ref_trajectory)):
-            distance = np.hypot(ref_trajectory[i, 0] - x, ref_trajectory[i, 1] - y)
-            if distance < min_distance:
-                min_distance = distance
-                target_index = i
+        target_index = self.find_closest_index(ref_trajectory, x, y)
 
         # Move forward to find the target point based on lookahead distance
         while target_index < len(ref_trajectory) and np.hypot(ref_trajectory[target_index, 0] - x, ref_trajectory[target_index, 1] - y) < self.lookahead_distance:
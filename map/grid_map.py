@@ -1,11 +1,62 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import random
 import math
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 from utils import transform_trajectory_with_angles
 
 from route_planner.geometry import Pose
 
+def _any_cross(px, py, qx, qy, A, B, dx_ab, dy_ab):
+    # intersect(line, [P, Q])를 각 선분에 대해 계산하다가 교차가 있으면 바로 True (ccw와 같은 비교식)
+    for k in range(A.shape[0]):
+        ax, ay, bx, by = A[k, 0], A[k, 1], B[k, 0], B[k, 1]
+        ccw_acd = (qy - ay) * (px - ax) > (py - ay) * (qx - ax)
+        ccw_bcd = (qy - by) * (px - bx) > (py - by) * (qx - bx)
+        if ccw_acd != ccw_bcd:
+            ccw_abc = (py - ay) * dx_ab[k] > dy_ab[k] * (px - ax)
+            ccw_abd = (qy - ay) * dx_ab[k] > dy_ab[k] * (qx - ax)
+            if ccw_abc != ccw_abd:
+                return True
+    return False
+
+def bresenham_walk(occ, x0, y0, x1, y1, draw):
+    # 정수 Bresenham으로 (x0, y0) -> (x1, y1) 셀을 양 끝점까지 따라간다
+    # draw=True이면 지나는 셀(격자 안쪽만)을 occ에 점유로 그리고 True를 반환
+    # draw=False이면 격자 밖이나 점유 셀을 만나면 바로 False (line of sight)
+    height, width = occ.shape
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    sx = 1 if x0 < x1 else -1
+    sy = 1 if y0 < y1 else -1
+    err = dx + dy
+    while True:
+        inside = 0 <= x0 < width and 0 <= y0 < height
+        if draw:
+            if inside:
+                occ[y0, x0] = True
+        elif not inside or occ[y0, x0]:
+            return False
+        if x0 == x1 and y0 == y1:
+            return True
+        e2 = 2 * err
+        if e2 >= dy:
+            err += dy
+            x0 += sx
+        if e2 <= dx:
+            err += dx
+            y0 += sy
+
+if njit is not None:
+    _any_cross = njit(cache=True)(_any_cross)
+    bresenham_walk = njit(cache=True)(bresenham_walk)
+else:
+    _any_cross = None
+
 class GridMap:
     def __init__(self, width=82, height=63, obstacles=None):
         self.width = width
@@ -16,6 +67,20 @@ class GridMap:
         self.obstacle_lines = []
         self.circular_obstacles = []
 
+        # obstacles 소속 여부를 빠르게 확인하기 위한 격자 (obstacles가 늘어날 때마다 동기화)
+        self._occ = np.zeros((self.height + 1, self.width + 1), dtype=bool)
+        self._off_grid_obstacles = set()
+        self._occ_source = self.obstacles
+        self._occ_count = 0
+
+        # obstacle_lines의 양 끝점 배열 (obstacle_lines가 늘어날 때마다 동기화)
+        self._line_starts = np.empty((0, 2))
+        self._line_ends = np.empty((0, 2))
+        self._line_dx = np.empty(0)
+        self._line_dy = np.empty(0)
+        self._line_source = self.obstacle_lines
+        self._line_count = 0
+
         # 외벽 생성
         self.create_outer_walls()
 
@@ -41,8 +106,44 @@ class GridMap:
         # 원형 장애물들의 (중심 좌표, 반지름)을 반환
         return self.circular_obstacles
 
+    def sync_obstacle_grid(self):
+        # obstacles는 append만 되므로 새로 추가된 항목만 반영, 리스트가 교체되면 다시 만든다
+        if self._occ_source is not self.obstacles:
+            self._occ = np.zeros((self.height + 1, self.width + 1), dtype=bool)
+            self._off_grid_obstacles = set()
+            self._occ_source = self.obstacles
+            self._occ_count = 0
+        for x, y in self.obstacles[self._occ_count:]:
+            if x == int(x) and y == int(y) and 0 <= x <= self.width and 0 <= y <= self.height:
+                self._occ[int(y), int(x)] = True
+            else:
+                self._off_grid_obstacles.add((x, y))
+        self._occ_count = len(self.obstacles)
+
     def is_obstacle(self, x, y):
-        return (x, y) in self.obstacles
+        if self._occ_count != len(self.obstacles) or self._occ_source is not self.obstacles:
+            self.sync_obstacle_grid()
+        if x == int(x) and y == int(y) and 0 <= x <= self.width and 0 <= y <= self.height:
+            return bool(self._occ[int(y), int(x)])
+        return (x, y) in self._off_grid_obstacles
+
+    def to_occupancy_array(self, include_lines=False):
+        # is_obstacle이 쓰는 동기화된 격자에 외벽을 더한 occ[y, x] 점유 격자 (height + 1, width + 1)
+        # 정수 좌표가 아닌 장애물은 셀 단위 격자에서는 가장 가까운 셀로 표시
+        # include_lines=True이면 obstacle_lines도 Bresenham으로 격자에 그린다
+        self.sync_obstacle_grid()
+        occ = self._occ.copy()
+        for x, y in self._off_grid_obstacles:
+            x, y = round(x), round(y)
+            if 0 <= x <= self.width and 0 <= y <= self.height:
+                occ[y, x] = True
+        if include_lines:
+            for (x0, y0), (x1, y1) in self.obstacle_lines:
+                bresenham_walk(occ, round(x0), round(y0), round(x1), round(y1), True)
+        # is_not_crossed_obstacle과 같이 맵 경계 (x = 0, width / y = 0, height)는 통과 불가
+        occ[[0, -1], :] = True
+        occ[:, [0, -1]] = True
+        return occ
 
     def is_valid_position(self, x, y):
         # 주어진 좌표가 장애물이 아니고 맵 범위 내에 있는지 확인
@@ -69,21 +170,42 @@ class GridMap:
             if self.is_valid_position(x, y):
                 return Pose(x, y, math.radians(90))
 
+    def sync_obstacle_line_arrays(self):
+        if self._line_source is not self.obstacle_lines or self._line_count != len(self.obstacle_lines):
+            lines = np.array(self.obstacle_lines, dtype=float).reshape(-1, 2, 2)
+            self._line_starts = lines[:, 0]
+            self._line_ends = lines[:, 1]
+            # 선분 방향 벡터 B - A는 고정이므로 한 번만 계산
+            self._line_dx = self._line_ends[:, 0] - self._line_starts[:, 0]
+            self._line_dy = self._line_ends[:, 1] - self._line_starts[:, 1]
+            self._line_source = self.obstacle_lines
+            self._line_count = len(self.obstacle_lines)
+
+    def any_cross(self, P, Q):
+        # 모든 obstacle line에 대해 intersect(line, [P, Q])를 한 번에 계산 (ccw와 같은 비교식)
+        self.sync_obstacle_line_arrays()
+        A, B = self._line_starts, self._line_ends
+        dx_ab, dy_ab = self._line_dx, self._line_dy
+        if _any_cross is not None:
+            return _any_cross(float(P[0]), float(P[1]), float(Q[0]), float(Q[1]), A, B, dx_ab, dy_ab)
+        ccw_acd = (Q[1] - A[:, 1]) * (P[0] - A[:, 0]) > (P[1] - A[:, 1]) * (Q[0] - A[:, 0])
+        ccw_bcd = (Q[1] - B[:, 1]) * (P[0] - B[:, 0]) > (P[1] - B[:, 1]) * (Q[0] - B[:, 0])
+        ccw_abc = (P[1] - A[:, 1]) * dx_ab > dy_ab * (P[0] - A[:, 0])
+        ccw_abd = (Q[1] - A[:, 1]) * dx_ab > dy_ab * (Q[0] - A[:, 0])
+        return bool(((ccw_acd != ccw_bcd) & (ccw_abc != ccw_abd)).any())
+
     def is_not_crossed_obstacle(self, previous_node, current_node):
-        is_cross_line = any(
-            self.intersect(obstacle_line, [previous_node, current_node])
-            for obstacle_line in self.obstacle_lines
-        )
+        # 값싼 범위/격자 검사를 먼저 하고 통과한 경우에만 선분 교차를 확인
+        if not (0 < current_node[0] < self.width and 0 < current_node[1] < self.height):
+            return False
+        if self.is_obstacle(current_node[0], current_node[1]):
+            return False
+        is_cross_line = self.any_cross(previous_node, current_node)
         is_cross_circle = any(
             self.intersect_circle(center_x, center_y, radius, previous_node, current_node)
             for center_x, center_y, radius in self.get_circle_obstacles()
         )
-        return (
-            current_node not in set(self.obstacles)
-            and 0 < current_node[0] < self.width
-            and 0 < current_node[1] < self.height
-            and not (is_cross_line or is_cross_circle)
-        )
+        return not (is_cross_line or is_cross_circle)
 
     # intersection check between rectangle obstacle and planning line
     def intersect(self, line1, line2):
@@ -2,7 +2,7 @@ import matplotlib.pyplot as plt
 import random
 import math
 
-from map.grid_map import GridMap
+from map.grid_map import GridMap, bresenham_walk
 
 from route_planner.geometry import Pose
 
@@ -22,6 +22,35 @@ class ParkingLot(GridMap):
         self.create_horizontal_lines()
         self.create_vertical_lines()
 
+        # 주차선은 모두 정수 좌표의 가로/세로 선분이라 격자에 그대로 그려진다
+        self._line_grid = None
+        self._line_grid_obstacles = None
+        self._line_grid_lines = None
+        self._line_grid_counts = None
+
+    def get_line_grid(self):
+        # 장애물/선분 리스트가 교체되거나 늘어나면 다시 만든다
+        counts = (len(self.obstacles), len(self.obstacle_lines))
+        if self._line_grid_obstacles is not self.obstacles or self._line_grid_lines is not self.obstacle_lines or self._line_grid_counts != counts:
+            self._line_grid = self.to_occupancy_array(include_lines=True)
+            self._line_grid_obstacles = self.obstacles
+            self._line_grid_lines = self.obstacle_lines
+            self._line_grid_counts = counts
+        return self._line_grid
+
+    def is_not_crossed_obstacle(self, previous_node, current_node):
+        # 양 끝점이 정수 좌표이고 출발 셀이 비어 있으면 선분이 그려진 점유 격자 위를 Bresenham으로 따라간다
+        # 실수 좌표는 반올림하면 셀 안쪽 이동의 교차를 놓치고, 선분 위에서 출발하는 경우는 교차 판정이 방향에 따라 달라
+        # 두 경우 모두 정확한 선분 교차 검사를 쓴다
+        x0, y0 = previous_node[0], previous_node[1]
+        x1, y1 = current_node[0], current_node[1]
+        if float(x0).is_integer() and float(y0).is_integer() and float(x1).is_integer() and float(y1).is_integer() \
+                and 0 <= x0 <= self.width and 0 <= y0 <= self.height:
+            line_grid = self.get_line_grid()
+            if not line_grid[int(y0), int(x0)]:
+                return bresenham_walk(line_grid, int(x0), int(y0), int(x1), int(y1), False)
+        return super().is_not_crossed_obstacle(previous_node, current_node)
+
     def create_horizontal_lines(self):
         # 주차장 내부의 가로선을 생성
         line_y_positions = list(range(self.space_height, self.height, self.space_height + 10))
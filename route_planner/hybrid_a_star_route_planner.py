@@ -7,6 +7,9 @@ https://github.com/AtsushiSakai/PythonRobotics/blob/master/PathPlanning/AStar/a_
 """
 
 import math
+import heapq
+import itertools
+import numpy as np
 import matplotlib.pyplot as plt
 import argparse
 import json
@@ -20,6 +23,8 @@ from map.random_grid_map import RandomGridMap
 from route_planner.geometry import Pose
 
 class Node:
+    __slots__ = ('pose', 'discrete_x', 'discrete_y', 'cost', 'steering', 'parent_node_index')
+
     def __init__(
             self,
             pose,
@@ -46,119 +51,161 @@ class HybridAStarRoutePlanner:
         steering_degree_inputs = [-40, -20, -10, 0, 10, 20, 40]
         self.steering_inputs = [math.radians(x) for x in steering_degree_inputs]
         self.chord_lengths = [2, 1]
+        # Motion primitives (chord_length, steering, heading change) are fixed, so tan(steering) is computed once
+        self.motion_primitives = [
+            (chord_length, steering, chord_length * math.tan(steering) / float(self.wheelbase))
+            for steering in self.steering_inputs
+            for chord_length in self.chord_lengths
+        ]
+        self.primitive_chord_lengths = np.array([p[0] for p in self.motion_primitives])
+        self.primitive_delta_thetas = np.array([p[2] for p in self.motion_primitives])
+        self.primitive_steering_costs = np.abs([p[1] for p in self.motion_primitives]) * 10
 
     def search_route(self, show_process=False):
-        open_set = {self.map_instance.get_grid_index(self.start_node.discrete_x, self.start_node.discrete_y): self.start_node}
-        closed_set = {}
-
-        while open_set:
-            current_node_index = min(
-                open_set,
-                key=lambda o: open_set[o].cost + self.calculate_heuristic_cost(open_set[o]),
-            )
-            current_node = open_set[current_node_index]
+        # Node state as flat arrays indexed by grid index (structure of arrays instead of Node objects)
+        grid_size = (self.map_instance.width + 1) * (self.map_instance.height + 1)
+        g_score = np.full(grid_size, np.inf)
+        parent_index = np.full(grid_size, -1, dtype=np.int32)
+        pose_x = np.zeros(grid_size)
+        pose_y = np.zeros(grid_size)
+        pose_theta = np.zeros(grid_size)
+        steering_at = np.zeros(grid_size)
+        closed = np.zeros(grid_size, dtype=bool)
+        closed_count = 0
+
+        # Obstacle checks between integer cells repeat across expansions, cache them for this search
+        edge_free_cache = {}
+
+        start_pose = self.start_node.pose
+        start_node_index = self.map_instance.get_grid_index(self.start_node.discrete_x, self.start_node.discrete_y)
+        g_score[start_node_index] = self.start_node.cost
+        pose_x[start_node_index], pose_y[start_node_index], pose_theta[start_node_index] = start_pose.x, start_pose.y, start_pose.theta
+        steering_at[start_node_index] = self.start_node.steering
+
+        # open set: (f = cost + heuristic, tie-breaker, cost, node index), f is computed once on push
+        counter = itertools.count()
+        start_f_score = self.start_node.cost + self.calculate_heuristic_cost(start_pose.x, start_pose.y, start_pose.theta, self.start_node.steering)
+        open_heap = [(start_f_score, next(counter), self.start_node.cost, start_node_index)]
+
+        while open_heap:
+            _, _, current_cost, current_node_index = heapq.heappop(open_heap)
+
+            # Lazy deletion: skip stale entries superseded by a cheaper path or already expanded
+            if closed[current_node_index] or current_cost > g_score[current_node_index]:
+                continue
+
+            x, y, theta = float(pose_x[current_node_index]), float(pose_y[current_node_index]), float(pose_theta[current_node_index])
+            discrete_x, discrete_y = round(x), round(y)
 
             if show_process:
-                self.plot_process(current_node, closed_set)
+                self.plot_process(discrete_x, discrete_y, closed_count)
 
-            if self.calculate_distance_to_end(current_node.pose) <= 1:
+            if self.calculate_distance_to_end(x, y) <= 1:
                 print("Find Goal")
-                self.goal_node = current_node
-                
-                rx, ry = self.process_route(closed_set)
+                self.goal_node = Node(Pose(x, y, theta), current_cost, steering_at[current_node_index], parent_index[current_node_index])
+
+                rx, ry = self.process_route(current_node_index, parent_index, pose_x, pose_y)
                 route_trajectory = transform_trajectory(rx, ry)
                 total_distance = calculate_trajectory_distance(route_trajectory)
                 return True, total_distance, route_trajectory
 
-            # Remove the item from the open set
-            del open_set[current_node_index]
-
             # Add it to the closed set
-            closed_set[current_node_index] = current_node
-
-            next_nodes = [
-                self.calculate_next_node(
-                    current_node, current_node_index, velocity, steering
-                )
-                for steering in self.steering_inputs
-                for velocity in self.chord_lengths
-            ]
-            for next_node in next_nodes:
-                if self.map_instance.is_not_crossed_obstacle(
-                        (current_node.discrete_x, current_node.discrete_y),
-                        (next_node.discrete_x, next_node.discrete_y),
-                ):
-                    next_node_index = self.map_instance.get_grid_index(next_node.discrete_x, next_node.discrete_y)
-                    if next_node_index in closed_set:
-                        continue
-
-                    if next_node_index not in open_set:
-                        open_set[next_node_index] = next_node  # discovered a new node
-                    else:
-                        if open_set[next_node_index].cost > next_node.cost:
-                            # This path is the best until now. record it
-                            open_set[next_node_index] = next_node
+            closed[current_node_index] = True
+            closed_count += 1
+
+            # Successors and their heuristics for all motion primitives at once
+            next_xs, next_ys, next_thetas, heuristic_costs = self.calculate_next_nodes(x, y, theta)
+            for (chord_length, steering, _), next_x, next_y, next_theta, heuristic_cost in zip(
+                    self.motion_primitives, next_xs.tolist(), next_ys.tolist(), next_thetas.tolist(), heuristic_costs.tolist()
+            ):
+                next_discrete_x, next_discrete_y = round(next_x), round(next_y)
+                edge = (discrete_x, discrete_y, next_discrete_x, next_discrete_y)
+                is_free = edge_free_cache.get(edge)
+                if is_free is None:
+                    is_free = self.map_instance.is_not_crossed_obstacle(
+                        (discrete_x, discrete_y),
+                        (next_discrete_x, next_discrete_y),
+                    )
+                    edge_free_cache[edge] = is_free
+                if not is_free:
+                    continue
+
+                next_node_index = self.map_instance.get_grid_index(next_discrete_x, next_discrete_y)
+                if closed[next_node_index]:
+                    continue
+
+                next_cost = current_cost + chord_length
+                if next_cost < g_score[next_node_index]:
+                    # discovered a new node or this path is the best until now. record it
+                    g_score[next_node_index] = next_cost
+                    parent_index[next_node_index] = current_node_index
+                    pose_x[next_node_index], pose_y[next_node_index], pose_theta[next_node_index] = next_x, next_y, next_theta
+                    steering_at[next_node_index] = steering
+                    f_score = next_cost + heuristic_cost
+                    heapq.heappush(open_heap, (f_score, next(counter), next_cost, next_node_index))
 
         print("Cannot find Route")
         return False, 0, []
 
-    def process_route(self, closed_set):
-        rx = [self.goal_node.pose.x]
-        ry = [self.goal_node.pose.y]
-        parent_node = self.goal_node.parent_node_index
-        while parent_node != -1:
-            n = closed_set[parent_node]
-            rx.append(n.pose.x)
-            ry.append(n.pose.y)
-            parent_node = n.parent_node_index
-        rx.reverse()
-        ry.reverse()
+    def process_route(self, goal_node_index, parent_index, pose_x, pose_y):
+        # Count the route length first, then fill from the back so no reversal is needed
+        route_length = 0
+        node_index = goal_node_index
+        while node_index != -1:
+            route_length += 1
+            node_index = parent_index[node_index]
+
+        rx = np.empty(route_length)
+        ry = np.empty(route_length)
+        node_index = goal_node_index
+        for i in range(route_length - 1, -1, -1):
+            rx[i] = pose_x[node_index]
+            ry[i] = pose_y[node_index]
+            node_index = parent_index[node_index]
         return rx, ry
 
-    def calculate_next_node(self, current, current_node_index, chord_length, steering):
-        theta = self.change_radians_range(
-            current.pose.theta + chord_length * math.tan(steering) / float(self.wheelbase)
-        )
-        x = current.pose.x + chord_length * math.cos(theta)
-        y = current.pose.y + chord_length * math.sin(theta)
+    def calculate_next_nodes(self, x, y, theta):
+        next_thetas = self.primitive_delta_thetas + theta
+        next_thetas -= 2 * np.pi * np.floor((next_thetas + np.pi) / (2 * np.pi))
+        next_xs = x + self.primitive_chord_lengths * np.cos(next_thetas)
+        next_ys = y + self.primitive_chord_lengths * np.sin(next_thetas)
 
-        return Node(
-            Pose(x, y, theta),
-            current.cost + chord_length,
-            steering,
-            current_node_index,
-        )
+        goal_pose = self.goal_node.pose
+        distance_costs = np.sqrt((next_xs - goal_pose.x) ** 2 + (next_ys - goal_pose.y) ** 2)
+        angle_diffs = next_thetas - goal_pose.theta
+        angle_costs = np.abs(angle_diffs - 2 * np.pi * np.floor((angle_diffs + np.pi) / (2 * np.pi))) * 0.1
+        heuristic_costs = distance_costs + angle_costs + self.primitive_steering_costs
+        return next_xs, next_ys, next_thetas, heuristic_costs
 
-    def calculate_heuristic_cost(self, node):
-        distance_cost = self.calculate_distance_to_end(node.pose)
-        angle_cost = abs(self.change_radians_range(node.pose.theta - self.goal_node.pose.theta)) * 0.1
-        steering_cost = abs(node.steering) * 10
+    def calculate_heuristic_cost(self, x, y, theta, steering):
+        distance_cost = self.calculate_distance_to_end(x, y)
+        angle_cost = abs(self.change_radians_range(theta - self.goal_node.pose.theta)) * 0.1
+        steering_cost = abs(steering) * 10
 
         cost = distance_cost + angle_cost + steering_cost
         return float(cost)
 
-    def calculate_distance_to_end(self, pose):
+    def calculate_distance_to_end(self, x, y):
         distance = math.sqrt(
-            (pose.x - self.goal_node.pose.x) ** 2 + (pose.y - self.goal_node.pose.y) ** 2
+            (x - self.goal_node.pose.x) ** 2 + (y - self.goal_node.pose.y) ** 2
         )
         return distance
 
     @staticmethod
-    # Imitation Code: https://stackoverflow.com/a/29237626
-    # Return radians range from -pi to pi
+    # Return radians range from -pi to pi (wrap with floor instead of atan2(sin, cos))
     def change_radians_range(angle):
-        return math.atan2(math.sin(angle), math.cos(angle))
+        return angle - 2 * math.pi * math.floor((angle + math.pi) / (2 * math.pi))
 
     @staticmethod
-    def plot_process(current_node, closed_set):
+    def plot_process(discrete_x, discrete_y, closed_count):
         # show graph
-        plt.plot(current_node.discrete_x, current_node.discrete_y, "xc")
+        plt.plot(discrete_x, discrete_y, "xc")
         # for stopping simulation with the esc key.
         plt.gcf().canvas.mpl_connect(
             "key_release_event",
             lambda event: [exit(0) if event.key == "escape" else None],
         )
-        if len(closed_set.keys()) % 10 == 0:
+        if closed_count % 10 == 0:
             plt.pause(0.001)
 
 def main():
@@ -15,38 +15,62 @@ from route_planner.rrt_star_planner import RRTStar
 class InformedRRTStar(RRTStar):
     def __init__(self, start, goal, map_instance, max_iter=700, search_radius=3, show_eclipse=False):
         super().__init__(start, goal, map_instance, max_iter, search_radius)
-        self.c_best = float("inf")  # Initialize the cost to reach the goal
         self.x_center = np.array([(self.start.x + self.goal.x) / 2.0, (self.start.y + self.goal.y) / 2.0])
-        self.c_min = np.linalg.norm(np.array([self.start.x, self.start.y]) - np.array([self.goal.x, self.goal.y]))
+        self.c_min = math.hypot(self.start.x - self.goal.x, self.start.y - self.goal.y)
         self.C = self.rotation_to_world_frame()
         self.show_eclipse = show_eclipse  # Flag to enable/disable eclipse drawing
+        # c_best가 바뀔 때만 다시 계산하는 샘플링 변환 행렬 M = C @ L과 이를 상수로 묶은 샘플러
+        self.M = None
+        self.M_c_best = None
+        self.sample_ellipse = None
 
     def rotation_to_world_frame(self):
         # Calculate the rotation matrix to align the ellipse with the path
-        direction = np.array([self.goal.x - self.start.x, self.goal.y - self.start.y])
-        direction = direction / np.linalg.norm(direction)
-        perpendicular = np.array([-direction[1], direction[0]])
-        return np.vstack((direction, perpendicular)).T
+        dx, dy = self.goal.x - self.start.x, self.goal.y - self.start.y
+        distance = math.hypot(dx, dy)
+        cos_theta, sin_theta = dx / distance, dy / distance
+        # 열 벡터가 경로 방향과 그 수직 방향
+        return np.array([[cos_theta, -sin_theta], [sin_theta, cos_theta]])
+
+    def calculate_transformation_matrix(self):
+        # 타원의 장축/단축 반지름
+        return np.diag([self.c_best / 2.0, math.sqrt(self.c_best**2 - self.c_min**2) / 2.0])
+
+    def transformation_matrix(self):
+        if self.M_c_best != self.c_best:
+            self.M = self.C @ self.calculate_transformation_matrix()
+            self.M_c_best = self.c_best
+            self.sample_ellipse = self.make_ellipse_sampler(self.M)
+        return self.M
+
+    def make_ellipse_sampler(self, M):
+        # M과 x_center를 스칼라 상수로 고정한 샘플러 (샘플마다 행렬 연산이나 배열 생성 없음)
+        m00, m01, m10, m11 = float(M[0, 0]), float(M[0, 1]), float(M[1, 0]), float(M[1, 1])
+        cx, cy = float(self.x_center[0]), float(self.x_center[1])
+        sample_unit_ball = self.sample_unit_ball
+
+        def sample_ellipse():
+            bx, by = sample_unit_ball()
+            return m00 * bx + m01 * by + cx, m10 * bx + m11 * by + cy
+
+        return sample_ellipse
 
     def sample(self, path_region=None):
         if self.c_best < float("inf"):
+            self.transformation_matrix()
             while True:
-                x_ball = self.sample_unit_ball()
-                x_rand = np.dot(np.dot(self.C, np.diag([self.c_best / 2.0, math.sqrt(self.c_best**2 - self.c_min**2) / 2.0])), x_ball)
-                x_rand = x_rand + self.x_center
-                x_rand_node = Node(x_rand[0], x_rand[1], 0.0)
+                x, y = self.sample_ellipse()
+                x_rand_node = Node(x, y, 0.0)
                 if self.is_within_map_instance(x_rand_node):
                     return x_rand_node
         else:
             return super().sample(path_region)
 
     def sample_unit_ball(self):
-        a = random.random()
-        b = random.random()
-        if b < a:
-            a, b = b, a
-        sample = np.array([b * math.cos(2 * math.pi * a / b), b * math.sin(2 * math.pi * a / b)])
-        return sample
+        # 반지름 sqrt(U)로 원 내부에서 균일하게 샘플링 (분기나 거부 없음)
+        r = math.sqrt(random.random())
+        theta = 2 * math.pi * random.random()
+        return r * math.cos(theta), r * math.sin(theta)
 
     def plot_process(self, node):
         plt.plot(node.x, node.y, "xc")
@@ -15,48 +15,44 @@ from route_planner.geometry import Pose, Node
 from route_planner.theta_star_planner import ThetaStar  # Assume Theta* is implemented here
 from route_planner.informed_rrt_star_planner import InformedRRTStar
 
+class PathRegion:
+    # 경로 구간들을 x1, y1, x2, y2 배열(SoA)로 저장하고 직선 거리 계산에 쓰는 항을 미리 계산
+    def __init__(self, x1, y1, x2, y2, margin):
+        self.x1 = np.asarray(x1, dtype=float)
+        self.y1 = np.asarray(y1, dtype=float)
+        self.x2 = np.asarray(x2, dtype=float)
+        self.y2 = np.asarray(y2, dtype=float)
+        self.margin = margin
+        self.dx = self.x2 - self.x1
+        self.dy = self.y2 - self.y1
+        self.c = self.x2 * self.y1 - self.y2 * self.x1
+        self.length = np.hypot(self.dy, self.dx)
+
 class InformedTRRTStar(InformedRRTStar):
     def __init__(self, start, goal, map_instance, max_iter=700, search_radius=10, show_eclipse=False):
         super().__init__(start, goal, map_instance, max_iter, search_radius)
 
     def narrow_sample(self, trajectory):
         # Narrow the sampling region based on the initial Theta* path
-        path_region = []
+        trajectory = np.asarray(trajectory, dtype=float)
         margin = self.search_radius / 2  # You can define the margin to your liking
-        for i in range(len(trajectory) - 1):
-            x1, y1 = trajectory[i]
-            x2, y2 = trajectory[i + 1]
-            path_region.append((x1, y1, x2, y2, margin))
-        return path_region
-
-    def calculate_transformation_matrix(self):
-        # Calculate the matrix L using the Cholesky decomposition as described in the text
-        a1 = self.c_best / 2.0
-        a2 = math.sqrt(self.c_best**2 - self.c_min**2) / 2.0
-        D = np.diag([a1, a2])
-
-        # Cholesky decomposition to calculate L
-        L = np.linalg.cholesky(D)
-        return L
+        return PathRegion(trajectory[:-1, 0], trajectory[:-1, 1], trajectory[1:, 0], trajectory[1:, 1], margin)
 
     def sample(self, path_region=None):
         if self.c_best < float("inf"):
+            self.transformation_matrix()
             while True:
-                x_ball = self.sample_unit_ball()
-                L = self.calculate_transformation_matrix()
-                x_rand = np.dot(self.C, np.dot(L, x_ball)) + self.x_center
-                x_rand_node = Node(x_rand[0], x_rand[1], 0.0)
+                x, y = self.sample_ellipse()
+                x_rand_node = Node(x, y, 0.0)
                 if self.is_within_map_instance(x_rand_node) and (path_region is None or self.is_within_region(x_rand_node, path_region)):
                     return x_rand_node
         else:
             return self.get_random_node(path_region)
 
     def is_within_region(self, node, path_region):
-        for (x1, y1, x2, y2, margin) in path_region:
-            d = abs((y2 - y1) * node.x - (x2 - x1) * node.y + x2 * y1 - y2 * x1) / math.hypot(y2 - y1, x2 - x1)
-            if d <= margin:
-                return True
-        return False
+        # 모든 경로 구간(직선)까지의 거리를 한 번에 계산
+        d = np.abs(path_region.dy * node.x - path_region.dx * node.y + path_region.c) / path_region.length
+        return bool(np.any(d <= path_region.margin))
 
     def get_random_node(self, path_region=None):
         while True:
@@ -67,17 +63,16 @@ class InformedTRRTStar(InformedRRTStar):
                 return node
 
     def search_best_parent(self, new_node, near_nodes):
-        best_parent = None
-        min_cost = float("inf")
-        for near_node in near_nodes:
-            if self.is_collision_free(near_node, new_node):
-                # Improved heuristic: combine distance to goal with path cost
-                # heuristic_cost = near_node.cost + math.hypot(new_node.x - near_node.x, new_node.y - near_node.y) + self.heuristic(new_node, self.goal)
-                heuristic_cost = near_node.cost + math.hypot(new_node.x - near_node.x, new_node.y - near_node.y) + 1.5 * self.heuristic(new_node, self.goal)
-                if heuristic_cost < min_cost:
-                    best_parent = near_node
-                    min_cost = heuristic_cost
-        return best_parent
+        # 목표까지의 휴리스틱은 near_node와 무관하므로 한 번만 계산
+        goal_cost = 1.5 * self.heuristic(new_node, self.goal)
+        # Improved heuristic: combine distance to goal with path cost
+        # heuristic_cost = near_node.cost + math.hypot(new_node.x - near_node.x, new_node.y - near_node.y) + self.heuristic(new_node, self.goal)
+        heuristic_costs = [near_node.cost + math.hypot(new_node.x - near_node.x, new_node.y - near_node.y) + goal_cost for near_node in near_nodes]
+        # 비용이 낮은 순서로 충돌 검사를 하고 처음으로 충돌이 없는 노드를 선택
+        for i in sorted(range(len(near_nodes)), key=heuristic_costs.__getitem__):
+            if self.is_collision_free(near_nodes[i], new_node):
+                return near_nodes[i]
+        return None
 
     def heuristic(self, node, goal):
         # Simple Euclidean distance as a heuristic
@@ -107,17 +102,18 @@ class InformedTRRTStar(InformedRRTStar):
     def smooth_path(self, trajectory):
         # 첫 번째 점을 바로 추가
         smooth_trajectory = [trajectory[0]]
+        trajectory = np.asarray(trajectory)
+        xs = np.round(trajectory[:, 0]).astype(np.int64)
+        ys = np.round(trajectory[:, 1]).astype(np.int64)
         i = 0
 
         while i < len(trajectory) - 1:
-            for j in range(len(trajectory) - 1, i, -1):
-                # trajectory에서 x, y를 직접 꺼내서 Node를 생성
-                if self.is_collision_free(Node(trajectory[i][0], trajectory[i][1], 0.0), 
-                                          Node(trajectory[j][0], trajectory[j][1], 0.0)):
-                    # 충돌이 없다면 해당 좌표를 smooth_trajectory에 추가
-                    smooth_trajectory.append(trajectory[j])
-                    i = j
-                    break
+            # i 이후 모든 점에 대한 충돌 검사를 한 번에 하고 충돌 없는 가장 먼 점을 선택
+            reachable = np.flatnonzero(self.is_collision_free_batch(xs[i], ys[i], xs[i + 1:], ys[i + 1:]))
+            # 보이는 점이 없으면 다음 점으로 진행
+            j = i + 1 + reachable[-1] if len(reachable) else i + 1
+            smooth_trajectory.append(trajectory[j])
+            i = j
 
         return np.array(smooth_trajectory)
 
@@ -1,17 +1,35 @@
 import math
 import random
+import numpy as np
 import matplotlib.pyplot as plt
 import json
 import argparse
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
 from utils import calculate_trajectory_distance, transform_trajectory
 
 from map.parking_lot import ParkingLot
 from map.fixed_grid_map import FixedGridMap
 from map.random_grid_map import RandomGridMap
+from map.grid_map import bresenham_walk
 
 from route_planner.geometry import Pose, Node
 
+def _los_batch(occ, x0, y0, xs, ys):
+    # (x0, y0)에서 각 (xs[k], ys[k])까지의 line of sight를 한 번에 계산
+    reachable = np.empty(len(xs), dtype=np.bool_)
+    for k in prange(len(xs)):
+        reachable[k] = bresenham_walk(occ, x0, y0, xs[k], ys[k], False)
+    return reachable
+
+if njit is not None:
+    _los_batch = njit(cache=True, parallel=True)(_los_batch)
+
 
 class RRTStar:
     def __init__(self, start, goal, map_instance, max_iter=300, search_radius=10):
@@ -20,8 +38,38 @@ class RRTStar:
         self.map_instance = map_instance
         self.max_iter = max_iter
         self.search_radius = search_radius
-        self.nodes = [self.start]
         self.goal_reached = False
+        # search_best_parent/rewire에 넘기는 근접 노드 수의 상한 (가까운 순)
+        self.max_near_nodes = 16
+
+        # 노드 좌표를 SoA 배열로도 저장 (노드는 한 번 추가되면 위치가 바뀌지 않음)
+        # 반복마다 최대 1개 + 목표 노드가 추가되므로 max_iter + 2개면 충분
+        self.node_x = np.empty(max_iter + 2)
+        self.node_y = np.empty(max_iter + 2)
+        # c_best로 더 나은 경로에 기여할 수 없게 된 노드는 False, 이후 search_route에서도 nearest/near 검색에서 제외
+        self._alive = np.ones(max_iter + 2, dtype=bool)
+        self.c_best = float("inf")
+        self.nodes = []
+        self._add_node(self.start)
+
+        # 장애물 셀과 obstacle_lines를 그린 점유 격자, JIT 컴파일은 생성 시 한 번
+        self.occ = map_instance.to_occupancy_array(include_lines=True)
+        bresenham_walk(self.occ, 0, 0, 0, 0, False)
+        # 격자 끝점 (x1, y1, x2, y2) -> 충돌 여부 (search_route마다 비우고, 가득 차면 비운다)
+        self.los_cache = {}
+        self.los_cache_size = 100000
+
+    def _add_node(self, node):
+        n = len(self.nodes)
+        if n == len(self.node_x):
+            # search_route를 다시 호출한 경우 등 배열이 가득 차면 두 배로 늘린다
+            self.node_x = np.resize(self.node_x, 2 * n)
+            self.node_y = np.resize(self.node_y, 2 * n)
+            self._alive = np.resize(self._alive, 2 * n)
+        self.node_x[n] = node.x
+        self.node_y[n] = node.y
+        self._alive[n] = True
+        self.nodes.append(node)
 
     def is_within_map_instance(self, node):
         return 0 <= node.x <= self.map_instance.width and 0 <= node.y <= self.map_instance.height
@@ -31,10 +79,31 @@ class RRTStar:
         y = random.uniform(0, self.map_instance.height)
         return Node(x, y, 0.0)
 
+    def get_node_distances2(self, node):
+        # 모든 노드까지의 제곱 거리 (삽입 순서), 가지치기된 노드는 무한대
+        n = len(self.nodes)
+        distances2 = (self.node_x[:n] - node.x) ** 2 + (self.node_y[:n] - node.y) ** 2
+        if self.c_best < float("inf"):
+            distances2[~self._alive[:n]] = float("inf")
+        return distances2
+
+    def prune_nodes(self):
+        # cost + 목표까지 직선 거리가 c_best보다 크면 더 나은 경로를 만들 수 없다
+        n = len(self.nodes)
+        costs = np.fromiter((node.cost for node in self.nodes), dtype=float, count=n)
+        self._alive[:n] &= costs + np.hypot(self.node_x[:n] - self.goal.x, self.node_y[:n] - self.goal.y) <= self.c_best
+
     def get_nearest_node_index(self, node):
-        dlist = [(n.x - node.x) ** 2 + (n.y - node.y) ** 2 for n in self.nodes]
-        min_index = dlist.index(min(dlist))
-        return min_index
+        return int(np.argmin(self.get_node_distances2(node)))
+
+    def get_near_nodes(self, node, radius):
+        distances2 = self.get_node_distances2(node)
+        near_indices = np.flatnonzero(distances2 <= radius ** 2)
+        if len(near_indices) > self.max_near_nodes:
+            # 가장 가까운 max_near_nodes개만 남기고 삽입 순서는 유지
+            nearest = np.argpartition(distances2[near_indices], self.max_near_nodes - 1)[:self.max_near_nodes]
+            near_indices = np.sort(near_indices[nearest])
+        return [self.nodes[i] for i in near_indices]
 
     def steer(self, from_node, to_node, extend_length=float("inf")):
         new_node = Node(from_node.x, from_node.y, from_node.cost, from_node)
@@ -56,27 +125,27 @@ class RRTStar:
         return distance, angle
 
     def is_collision_free(self, node1, node2):
-        x1, y1 = node1.x, node1.y
-        x2, y2 = node2.x, node2.y
-
-        # Check if the path crosses any obstacle line
-        for line in self.map_instance.obstacle_lines:
-            if self.map_instance.intersect(line, [(x1, y1), (x2, y2)]):
-                return False
-
-        # Check if the path crosses any obstacle grid cell
-        return self.map_instance.is_not_crossed_obstacle((round(x1), round(y1)), (round(x2), round(y2)))
+        # Check the grid cells along the path (obstacle cells and rasterized obstacle lines)
+        key = (round(node1.x), round(node1.y), round(node2.x), round(node2.y))
+        is_free = self.los_cache.get(key)
+        if is_free is None:
+            is_free = bresenham_walk(self.occ, *key, False)
+            if len(self.los_cache) >= self.los_cache_size:
+                self.los_cache.clear()
+            self.los_cache[key] = is_free
+        return is_free
+
+    def is_collision_free_batch(self, x0, y0, xs, ys):
+        # 격자 좌표 (x0, y0)에서 xs, ys 각 점까지 충돌이 없는지 bool 배열로 반환
+        return _los_batch(self.occ, x0, y0, xs, ys)
 
     def search_best_parent(self, new_node, near_nodes):
-        best_parent = None
-        min_cost = float("inf")
-        for near_node in near_nodes:
-            if self.is_collision_free(near_node, new_node):
-                cost = near_node.cost + math.hypot(new_node.x - near_node.x, new_node.y - near_node.y)
-                if cost < min_cost:
-                    best_parent = near_node
-                    min_cost = cost
-        return best_parent
+        # 비용 오름차순(동점이면 원래 순서)으로 보고 처음으로 충돌이 없는 노드가 최적의 부모
+        costs = [near_node.cost + math.hypot(new_node.x - near_node.x, new_node.y - near_node.y) for near_node in near_nodes]
+        for i in sorted(range(len(near_nodes)), key=costs.__getitem__):
+            if self.is_collision_free(near_nodes[i], new_node):
+                return near_nodes[i]
+        return None
 
     def rewire(self, new_node, near_nodes):
         for near_node in near_nodes:
@@ -88,6 +157,9 @@ class RRTStar:
 
     def search_route(self, show_process=False, path_region=None):
         self.goal_reached = False
+        self.los_cache.clear()
+        # 반경 비교는 제곱 거리로
+        search_radius2 = self.search_radius ** 2
         for _ in range(self.max_iter):
             rand_node = self.sample(path_region)
             nearest_node = self.nodes[self.get_nearest_node_index(rand_node)]
@@ -96,23 +168,27 @@ class RRTStar:
             if not self.is_collision_free(nearest_node, new_node):
                 continue
 
-            near_nodes = [node for node in self.nodes if math.hypot(node.x - new_node.x, node.y - new_node.y) <= self.search_radius]
+            near_nodes = self.get_near_nodes(new_node, self.search_radius)
             best_parent = self.search_best_parent(new_node, near_nodes)
 
             if best_parent:
                 new_node = self.steer(best_parent, new_node)
                 new_node.parent = best_parent
 
-            self.nodes.append(new_node)
+            self._add_node(new_node)
             self.rewire(new_node, near_nodes)
 
-            if math.hypot(new_node.x - self.goal.x, new_node.y - self.goal.y) <= self.search_radius:
+            if (new_node.x - self.goal.x) ** 2 + (new_node.y - self.goal.y) ** 2 <= search_radius2:
                 final_node = self.steer(new_node, self.goal)
                 if self.is_collision_free(new_node, final_node):
                     self.goal = final_node
                     self.goal.parent = new_node
-                    self.nodes.append(self.goal)
+                    self._add_node(self.goal)
                     self.goal_reached = True
+                    # c_best가 줄면 가지치기, 이후 search_route 호출은 c_best 타원 안에서 샘플링
+                    if self.goal.cost < self.c_best:
+                        self.c_best = self.goal.cost
+                        self.prune_nodes()
                     print("Goal Reached")
                     break
 
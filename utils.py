@@ -19,50 +19,40 @@ def transform_trajectory(x_array, y_array):
 
 def transform_trajectory_with_angles(trajectory, num_points=30, velocity=2.0, last_segment_factor=1):
     trajectory = np.array(trajectory)  # trajectory를 numpy 배열로 변환
-    
+
     n = len(trajectory)
-    transformed_list = []
+    if n < 2:
+        return np.array([])
 
-    for i in range(n - 1):
-        # Get segment start and end
-        x_start, y_start = trajectory[i][:2]
-        x_end, y_end = trajectory[i + 1][:2]
-        
-        # Calculate angle for current segment
-        theta_current = calculate_angle(x_start, y_start, x_end, y_end)
-        
-        # Calculate angle for the next segment
-        if i < n - 2:
-            x_next_start, y_next_start = trajectory[i + 1][:2]
-            x_next_end, y_next_end = trajectory[i + 2][:2]
-            theta_next = calculate_angle(x_next_start, y_next_start, x_next_end, y_next_end)
-        else:
-            # Use the same angle for the last segment if there's no next segment
-            theta_next = theta_current
-        
-        # Average angle between current and next segment
-        theta_avg = (theta_current + theta_next) / 2.0
-        
-        # Adjust the number of points for the last segment
-        if i == n - 2:
-            # Increase the number of interpolation points for the last segment
-            num_points_last = num_points * last_segment_factor
-            x_interp = np.linspace(x_start, x_end, num=num_points_last, endpoint=False)
-            y_interp = np.linspace(y_start, y_end, num=num_points_last, endpoint=False)
-        else:
-            # Regular interpolation for other segments
-            x_interp = np.linspace(x_start, x_end, num=num_points, endpoint=False)
-            y_interp = np.linspace(y_start, y_end, num=num_points, endpoint=False)
-        
-        # Add the last point of the segment explicitly
-        x_interp = np.append(x_interp, x_end)
-        y_interp = np.append(y_interp, y_end)
-        
-        # Add points with the average angle to the final list
-        for x, y in zip(x_interp, y_interp):
-            transformed_list.append([x, y, theta_avg, velocity])
-    
-    return np.array(transformed_list)
+    # Segment start / end points and angles for all segments at once
+    starts = trajectory[:-1, :2].astype(float)
+    ends = trajectory[1:, :2].astype(float)
+    deltas = ends - starts
+    theta_current = np.arctan2(deltas[:, 1], deltas[:, 0])
+
+    # Use the same angle for the last segment if there's no next segment
+    theta_next = np.append(theta_current[1:], theta_current[-1])
+
+    # Average angle between current and next segment
+    theta_avg = (theta_current + theta_next) / 2.0
+
+    # Interpolation points per segment (num_points, endpoint=False) + the segment end point explicitly
+    counts = np.full(n - 1, num_points)
+    counts[-1] = num_points * last_segment_factor  # Increase the number of interpolation points for the last segment
+    segment_ids = np.repeat(np.arange(n - 1), counts + 1)
+    offsets = np.cumsum(counts + 1) - (counts + 1)
+    steps = np.arange(len(segment_ids)) - offsets[segment_ids]
+    is_end = steps == counts[segment_ids]
+
+    # Same arithmetic as np.linspace(start, end, num=count, endpoint=False)
+    points = starts[segment_ids] + steps[:, None] * (deltas[segment_ids] / counts[segment_ids, None])
+    points[is_end] = ends[segment_ids[is_end]]
+
+    transformed = np.empty((len(segment_ids), 4))
+    transformed[:, :2] = points
+    transformed[:, 2] = theta_avg[segment_ids]
+    transformed[:, 3] = velocity
+    return transformed
 
 # def transform_trajectory_with_angles(x_array, y_array, num_points=20, velocity=2.0, last_segment_factor=5):
 #     x_array = np.array(x_array)